@@ -1,3 +1,5 @@
+import sys
+
 import matplotlib
 matplotlib.use('TKAgg')
 import matplotlib.pyplot as plt
@@ -6,14 +8,25 @@ from matplotlib.animation import FuncAnimation
 from busstop.objects import Bus, BusStop, BusPassenger
 from busstop.linear import LinearBusRouteModel
 
-def animate_model(model):
+def animate_model(model, log_every=60):
     fig = plt.figure()
     ax = fig.add_axes([0, 0, 1, 1])
 
-    time = -1  # time
-    events = model.init()
-    for event in events:
-        print((time,) + event)
+    # Events are logged in batches of log_every frames rather than printed
+    # one line at a time from the drawing loop.
+    log = []
+
+    def flush_log(*args):
+        if log:
+            sys.stdout.write(''.join(repr(event) + '\n' for event in log))
+            sys.stdout.flush()
+            log.clear()
+
+    fig.canvas.mpl_connect('close_event', flush_log)
+
+    # Initial events are logged at time -1
+    log.extend((-1,) + event for event in model.init())
+    flush_log()
 
     def init():
         # Initialise the graphics
@@ -21,12 +34,14 @@ def animate_model(model):
 
     def update(frame_number):
         # Update the simulation
-        time = frame_number
         events = model.update()
-        for event in events:
-            print((time,) + event)
+        if events:
+            log.extend((frame_number,) + event for event in events)
+        if frame_number % log_every == 0:
+            flush_log()
         # Update the graphics
         return model.update_animation()
 
     animation = FuncAnimation(fig, update, init_func=init, blit=True)
     plt.show()
+    flush_log()
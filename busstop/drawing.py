@@ -0,0 +1,33 @@
+##########################
+#  drawing.py
+#
+#  This file defines helpers used to lay out the markers of the matplotlib
+#  animation. It is only imported when animating, so the rest of the model
+#  does not need NumPy.
+##########################
+
+import numpy as np
+
+
+def positions(objects):
+    """Array of the (x, y) positions of objects for Collection.set_offsets"""
+    return np.array([obj.position for obj in objects], dtype=float).reshape(-1, 2)
+
+
+def stacked_offsets(positions, counts, spacing):
+    """Array of counts[i] markers stacked at spacing above positions[i]
+
+        >>> stacked_offsets(np.array([[0, 0], [10, 0]], dtype=float), [1, 2], 2).tolist()
+        [[0.0, 2.0], [10.0, 2.0], [10.0, 4.0]]
+    """
+    counts = np.asarray(counts, dtype=int)
+    offsets = np.repeat(positions, counts, axis=0)
+    starts = np.cumsum(counts) - counts
+    nth = np.arange(len(offsets)) - np.repeat(starts, counts)
+    offsets[:, 1] += spacing * (nth + 1)
+    return offsets
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -5,11 +5,34 @@
 #  bus picking up passengers from bus stops.
 ##########################
 
+import heapq
+import math
 import random
 
 from busstop.objects import BusStop, Bus, BusPassenger, BusNetwork
 
 
+def _arrival_scale(rate):
+    """Scale turning a uniform draw into a geometric waiting time for rate
+
+    Returns None for a stop that never gets arrivals and 0.0 for one that
+    gets an arrival every time step.
+    """
+    if rate <= 0:
+        return None
+    if rate >= 1:
+        return 0.0
+    # log1p stays accurate for tiny rates, where log(1 - rate) would round
+    # to 0. A rate too small to invert gives no arrivals.
+    log_stay = math.log1p(-rate)
+    if log_stay == 0.0:
+        return None
+    scale = 1.0 / log_stay
+    if math.isinf(scale):
+        return None
+    return scale
+
+
 class LinearBusRouteModel(BusNetwork):
     """Linear bus route with stops and buses
 
@@ -21,9 +44,12 @@ class LinearBusRouteModel(BusNetwork):
     stops: list[BusStop], list of bus stops
     buses: list[Bus], list of the buses on the route
     rates: dict[str,float] (optional) rates of passengers arriving
+    seed: int (optional) seed for the model's random number generator
 
     A LinearBusRoute instances holds a complete model of the state of all
-    buses, bus stops and passengers along its route.
+    buses, bus stops and passengers along its route. The arrival rates are
+    read once: init() schedules arrivals from them, so changing self.rates
+    afterwards has no effect until init() is called again.
 
     Examples
     ========
@@ -46,8 +72,40 @@ class LinearBusRouteModel(BusNetwork):
     East St to West St. Joan is waiting at the West St bus stop. Dave is on
     the bus which is already heading to East St and is currently at
     coordinate 20.
+
+    Passengers arrive at random, and buses with no set speed move a random
+    distance each step, but a seed makes a run reproducible:
+
+        >>> def run(seed):
+        ...     stops = [BusStop('West St', (0, 0), []), BusStop('East St', (10, 0), [])]
+        ...     bus = Bus('56', (0, 0), 1, [], max_speed=3)
+        ...     model = LinearBusRouteModel(0, 100, stops, [bus], {'West St': 0.5}, seed)
+        ...     model.init()
+        ...     arrivals = [len(model.update()) for _ in range(6)]
+        ...     destinations = [p.destination for p in stops[0].passengers]
+        ...     return arrivals, bus.position, destinations
+        >>> run(1)
+        ([1, 1, 0, 1, 1, 0], (8, 0), ['East St', 'East St', 'East St', 'East St'])
+        >>> run(2)
+        ([0, 0, 0, 0, 1, 1], (7, 0), ['East St', 'West St'])
     """
 
+    def __init__(self, start, end, stops, buses, rates=None, seed=None):
+        super().__init__(start, end, stops, buses, rates)
+
+        # A private generator makes runs reproducible given a seed. Its bound
+        # methods are kept to save the lookups in the per-step code.
+        self._rng = random.Random(seed)
+        self._random = self._rng.random
+        self._randint = self._rng.randint
+        self._choice = self._rng.choice
+
+        # No arrivals are scheduled until init(), which also resets these,
+        # but update() still works without it
+        self.passenger_num = 0
+        self.time = 0
+        self._arrivals = []
+
     def init(self):
         """Initialise the model and return initial events.
 
@@ -64,6 +122,15 @@ class LinearBusRouteModel(BusNetwork):
         56 bus.
         """
         self.passenger_num = 0
+        self.time = 0
+
+        # Pending passenger arrivals as a heap of (time, stop index). The
+        # per-stop scale turns a uniform draw into a geometric waiting time.
+        self._arrival_scales = [_arrival_scale(self.rates.get(stop.name, 0))
+                                for stop in self.stops]
+        self._arrivals = []
+        for index in range(len(self.stops)):
+            self.schedule_arrival(index)
 
         events = []
         for stop in self.stops:
@@ -95,63 +162,124 @@ class LinearBusRouteModel(BusNetwork):
         This shows that at the start of the simulation Sally boards the number
         56 bus. In the first time step Sally gets on the bus. In the second
         timestep there are no events.
+
+        A model can be stepped without calling init(), in which case no
+        passengers arrive:
+
+            >>> model = LinearBusRouteModel(0, 100, [], [], {'East St': 1})
+            >>> model.update()
+            []
         """
+        self.time += 1
         events = []
 
+        # Buses, stops and passengers are the public objects the doctests and
+        # the animation work with, and there are only a handful of them, so
+        # they are updated in place rather than mirrored into NumPy arrays.
         for bus in self.buses:
-            events += self.update_bus(bus)
+            events.extend(self.update_bus(bus))
 
-        for stop in self.stops:
-            events += self.update_stop(stop)
+        # Passengers left waiting lose patience once per time step
+        self.update_stop_passengers_patience()
+
+        # Only stops with an arrival due this time step are visited
+        arrivals = self._arrivals
+        while arrivals and arrivals[0][0] <= self.time:
+            _, index = heapq.heappop(arrivals)
+            events.extend(self.passenger_arrives(self.stops[index]))
+            self.schedule_arrival(index)
 
         return events
 
     def update_bus(self, bus):
-        """Update simulation state of bus."""
+        """Update simulation state of bus, yielding any events.
 
-        # If bus speed is set to any value <= 0, randomize it instead.
-        speed = bus.speed if bus.speed > 0 else random.randint(1, bus.max_speed)
-        old_x, old_y = bus.position
-        new_x = old_x + speed * bus.direction
-        new_y = old_y  # Buses move horizontally
-        bus.position = (new_x, old_y)
+        A fast bus stops at every stop it passed in order along the route:
 
-        events = []
+            >>> stops = [BusStop('B', (20, 0), []), BusStop('A', (10, 0), [])]
+            >>> bus = Bus('56', (0, 0), 1, [], speed=25)
+            >>> model = LinearBusRouteModel(0, 100, stops, [bus])
+            >>> model.init()
+            []
+            >>> list(model.update_bus(bus))
+            [('stops', '56', 'A'), ('stops', '56', 'B')]
 
-        # Does the bus stop at any stops?
-        if bus.direction == 1:
-            # The bus is travelling left to right
-            for stop in self.stops:
-                stop_x, stop_y = stop.position
-                if old_x < stop_x <= new_x:
-                    events += self.stop_at(bus, stop)
-        else:
-            # The bus is traveling right to left - we assume it doesn't
-            # stop or pick up passengers as all our passengers travel left
-            # to right.
-            pass
+        On the way back it passes them without looking for stops at all:
 
-        # Update stop passengers patience value
-        self.update_stop_passengers_patience()
+            >>> bus.direction = -1
+            >>> list(model.update_bus(bus))
+            []
+            >>> bus.position
+            (0, 0)
+        """
+
+        # If bus speed is set to any value <= 0, randomize it instead.
+        speed = bus.speed if bus.speed > 0 else self._randint(1, bus.max_speed)
+        direction = bus.direction
+        old_x = bus.x
+        new_x = old_x + speed * direction
+        bus.x = new_x  # Buses move horizontally
+
+        # Does the bus stop at any stops? Only when travelling left to right:
+        # we assume a bus traveling right to left doesn't stop or pick up
+        # passengers as all our passengers travel left to right.
+        if direction == 1:
+            for stop in self.stops_passed(old_x, new_x):
+                yield from self.stop_at(bus, stop)
 
         # Does the bus turn around?
         if not (self.start <= new_x <= self.end):
-            bus.direction = - bus.direction
-            events.append(('turns', bus.name))
-
-        return events
+            bus.direction = - direction
+            yield ('turns', bus.name)
 
     def update_stop_passengers_patience(self):
+        """Decrease the patience of every passenger waiting at a stop.
+
+        This happens once per time step however many buses there are:
+
+            >>> sally = BusPassenger('Sally', 'A', 'B', patience=5)
+            >>> stop = BusStop('A', (50, 0), [sally])
+            >>> buses = [Bus('1', (0, 0), 1, []), Bus('2', (10, 0), 1, [])]
+            >>> model = LinearBusRouteModel(0, 100, [stop], buses)
+            >>> events = model.init()
+            >>> events = model.update()
+            >>> sally.patience
+            4
+
+        Patience never drops below 0, and a negative value is clamped to 0:
+
+            >>> sally.patience = -3
+            >>> model.update_stop_passengers_patience()
+            >>> sally.patience
+            0
+        """
         for stop in self.stops:
             for passenger in stop.passengers:
                 # 0 represents the peak of the grumpy scale i.e. passenger has lost all patience.
-                passenger.patience = max(passenger.patience - 1, 0)
+                if passenger.patience > 0:
+                    passenger.patience -= 1
+                else:
+                    passenger.patience = 0
 
 
     def stop_at(self, bus, stop):
-        """Handle bus stopping at stop."""
+        """Handle bus stopping at stop, yielding the events.
+
+        Waiting passengers board in order until the bus is full:
 
-        # Passengers get off if this is their stop
+            >>> queue = [BusPassenger(name, 'A', 'B') for name in 'xyz']
+            >>> stop = BusStop('A', (0, 0), queue)
+            >>> bus = Bus('56', (0, 0), 1, [], capacity=2)
+            >>> model = LinearBusRouteModel(0, 100, [stop], [bus])
+            >>> list(model.stop_at(bus, stop))
+            [('stops', '56', 'A'), ('boards', 'x', 'A'), ('boards', 'y', 'A')]
+            >>> stop.passengers
+            [BusPassenger('z', 'A', 'B')]
+        """
+
+        # Passengers get off if this is their stop. A bus only carries a few
+        # passengers, so one pass over them beats keeping them grouped by
+        # destination, and bus.passengers stays a plain list.
         staying_passengers = []
         leaving_passengers = []
         for passenger in bus.passengers:
@@ -160,43 +288,71 @@ class LinearBusRouteModel(BusNetwork):
             else:
                 staying_passengers.append(passenger)
 
-        # All passengers waiting at the bus stop get on
-        boarding_passengers_count = bus.capacity - len(staying_passengers)
-        boarding_passengers = stop.passengers[:boarding_passengers_count] if bus.capacity >= 0 \
-            else stop.passengers
+        # Passengers waiting at the bus stop get on while there is room
+        if bus.capacity >= 0:
+            boarding_passengers_count = max(bus.capacity - len(staying_passengers), 0)
+        else:
+            boarding_passengers_count = len(stop.passengers)
+        boarding_passengers = stop.passengers[:boarding_passengers_count]
 
-        # Actually update passengers at bus and stop
-        bus.passengers = staying_passengers + boarding_passengers
-        stop.passengers = stop.passengers[boarding_passengers_count:] if bus.capacity >= 0 \
-            else stop.passengers
+        # Actually update passengers at bus and stop in place
+        del stop.passengers[:boarding_passengers_count]
+        staying_passengers += boarding_passengers
+        bus.passengers = staying_passengers
 
         # Record events for everyone getting on and off
-        events = [('stops', bus.name, stop.name)]
+        yield ('stops', bus.name, stop.name)
         for passenger in leaving_passengers:
-            events.append(('alights', passenger.name, stop.name))
+            yield ('alights', passenger.name, stop.name)
         for passenger in boarding_passengers:
-            events.append(('boards', passenger.name, stop.name))
-        return events
+            yield ('boards', passenger.name, stop.name)
 
-    def update_stop(self, stop):
-        """Update bus stop"""
-
-        # New passengers arrive randomly at each bus stop. The probability of
-        # a passenger arriving at particular stop is given by
-        #     1 - self.rates[self.name].
-        if stop.name in self.rates:
-            rate = self.rates[stop.name]
-            if rate > random.random():
-                # A new passenger randomly arrives. They go to a randomly chosen destination.
-                print(random.randint(0, len(self.stops)))
-                destination = self.stops[random.randint(0, len(self.stops) - 1)].name
-                name = 'random' + str(self.passenger_num)
-                self.passenger_num += 1
-                passenger = BusPassenger(name, stop.name, destination)
-                stop.passengers.append(passenger)
-                return [('waits', passenger.name, stop.name)]
-
-        return []
+    def schedule_arrival(self, index):
+        """Schedule the next passenger arrival at the stop self.stops[index].
+
+        A passenger arrives at a stop in any time step with probability
+        self.rates[stop.name]. Rather than rolling for every stop at every
+        step, the number of steps until the next arrival is drawn directly
+        from the matching geometric distribution and pushed onto a heap:
+
+            >>> stop = BusStop('East St', (0, 0), [])
+            >>> model = LinearBusRouteModel(0, 100, [stop], [], {'East St': 1})
+            >>> model.init()
+            []
+            >>> model.update()
+            [('waits', 'random0', 'East St')]
+            >>> model.update()
+            [('waits', 'random1', 'East St')]
+
+        Tiny rates are handled without rounding the probability to zero:
+
+            >>> stop = BusStop('East St', (0, 0), [])
+            >>> model = LinearBusRouteModel(0, 100, [stop], [], {'East St': 1e-17})
+            >>> model.init()
+            []
+            >>> model.update()
+            []
+        """
+        scale = self._arrival_scales[index]
+        if scale is None:
+            return
+        wait = math.log1p(-self._random()) * scale
+        if not math.isfinite(wait):
+            # Too far in the future to ever happen
+            return
+        wait = int(wait) + 1
+        heapq.heappush(self._arrivals, (self.time + wait, index))
+
+    def passenger_arrives(self, stop):
+        """A new passenger arrives at stop, yielding the event"""
+
+        # They go to a randomly chosen destination.
+        destination = self._choice(self._stop_names)
+        name = 'random' + str(self.passenger_num)
+        self.passenger_num += 1
+        passenger = BusPassenger.unchecked(name, stop.name, destination)
+        stop.passengers.append(passenger)
+        yield ('waits', passenger.name, stop.name)
 
 
 if __name__ == "__main__":
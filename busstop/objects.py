@@ -4,7 +4,10 @@
 #  This file defines classes that make up the main actors in a simulation of a
 #  bus picking up passengers from bus stops.
 ##########################
+import operator
 import random
+import sys
+from bisect import bisect_right
 
 
 class Printable:
@@ -24,10 +27,18 @@ class Printable:
         >>> t
         Thing(3, 'qwe')
     """
+    __slots__ = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Look up the attribute getters once per class rather than per repr.
+        # A class without parameters gets none, so its repr still fails.
+        if hasattr(cls, 'parameters'):
+            cls._repr_getters = tuple(map(operator.attrgetter, cls.parameters))
+
     def __repr__(self):
-        classname = type(self).__name__
-        args = [getattr(self, p) for p in self.parameters]
-        return '%s(%s)' % (classname, ', '.join(map(repr, args)))
+        args = ', '.join([repr(getter(self)) for getter in self._repr_getters])
+        return f'{type(self).__name__}({args})'
 
 
 class BusPassenger(Printable):
@@ -53,7 +64,20 @@ class BusPassenger(Printable):
 
         >>> dave.name
         'Dave'
+
+    Subclasses of str are accepted as names:
+
+        >>> class Name(str):
+        ...     pass
+        >>> BusPassenger('Dave', Name('A'), 'B').source
+        'A'
+
+    Passengers created by the simulation itself skip argument checking:
+
+        >>> BusPassenger.unchecked('Joan', 'A', 'B', 3).patience
+        3
     """
+    __slots__ = 'name', 'source', 'destination', 'patience'
     parameters = 'name', 'source', 'destination'
 
     def __init__(self, name, source, destination, patience=5, max_patience=10):
@@ -64,11 +88,28 @@ class BusPassenger(Printable):
             raise TypeError('Max patience has to be a positive whole number. It cannot be a value <= 0.')
 
         self.name = name
-        self.source = source
-        self.destination = destination
+        # Stop names are interned (as plain str, since subclasses can't be)
+        # so that stop_at matching a destination to a stop name is usually
+        # an identity check.
+        self.source = sys.intern(str(source))
+        self.destination = sys.intern(str(destination))
         # If patience is set to a value <= 0, we randomly generate a patience value b/w 0 and max_patience instead.
         self.patience = random.randint(0, max_patience) if patience <= 0 else patience
 
+    @classmethod
+    def unchecked(cls, name, source, destination, patience=5):
+        """Create a passenger without validating the arguments
+
+        This is for passengers created while the simulation runs, whose
+        arguments are already known to be valid. patience is used as given.
+        """
+        passenger = cls.__new__(cls)
+        passenger.name = name
+        passenger.source = source
+        passenger.destination = destination
+        passenger.patience = patience
+        return passenger
+
 
 class BusStop(Printable):
     """Bus stop along a bus route with a position and passengers
@@ -91,6 +132,7 @@ class BusStop(Printable):
         BusStop('West St', (20, 0), [BusPassenger('Dave', 'West St', 'East St')])
 
     """
+    __slots__ = 'name', 'position', 'passengers'
     parameters = 'name', 'position', 'passengers'
 
     def __init__(self, name, position, passengers):
@@ -105,48 +147,10 @@ class BusStop(Printable):
         if not all(p.source == name for p in passengers):
             raise ValueError('passenger at the wrong stop')
 
-        self.name = name
+        self.name = sys.intern(str(name))
         self.position = position
         self.passengers = list(passengers)
 
-    def init_animation(self, ax):
-        """Initialise matplotlib animation for axes ax"""
-        self.ax = ax
-        self.stop_line, = ax.plot([], [], 'ro', markersize=10)
-        self.not_grumpy_line, = ax.plot([], [], 'bo')
-        self.grumpy_line, = ax.plot([], [], 'ro')
-        x, y = self.position
-        self.text = ax.text(x, y-3, self.name, rotation=90,
-                verticalalignment='top', horizontalalignment='center')
-        return [self.stop_line, self.not_grumpy_line, self.grumpy_line, self.text]
-
-    def update_animation(self):
-        """Update matplotlib animation for axes ax"""
-        x, y = self.position
-        # Redraw the bus stop
-        self.stop_line.set_data([x], [y])
-        # Redraw the queueing passingers
-        qspace = 2
-        num_passengers = len(self.passengers)
-        # Number of passengers who have exhausted 100% of their patience
-        num_grumpy_passengers = len([passenger for passenger in self.passengers if passenger.patience == 0])
-        xdata = [x] * num_grumpy_passengers
-        ydata = [y + qspace*(n+1) for n in range(num_grumpy_passengers)]
-        self.grumpy_line.set_color('red')
-        # Plot all grumpy passengers first
-        self.grumpy_line.set_data(xdata, ydata)
-
-        # Plot all non grumpy passengers
-        if num_passengers > num_grumpy_passengers:
-            xdata = [x] * (num_passengers - num_grumpy_passengers)
-            if num_grumpy_passengers > 0:
-                y += num_grumpy_passengers * qspace
-            ydata = [y + qspace * (n + 1) for n in range(num_passengers - num_grumpy_passengers)]
-            self.not_grumpy_line.set_data(xdata, ydata)
-
-        # Return the patches for matplotlib to update
-        return [self.stop_line, self.not_grumpy_line, self.grumpy_line, self.text]
-
 
 class Bus(Printable):
     """Bus traversing a linear bus route
@@ -170,6 +174,8 @@ class Bus(Printable):
         Bus('Number 47', (20, 0), 1, [BusPassenger('Dave', 'West St', 'East St')])
 
     """
+    __slots__ = ('name', 'x', 'y', 'direction', 'passengers', 'capacity',
+                 'speed', 'max_speed')
     parameters = 'name', 'position', 'direction', 'passengers'
 
     def __init__(self, name, position, direction, passengers, capacity=-1, speed=-1, max_speed=2):
@@ -185,8 +191,10 @@ class Bus(Printable):
             raise TypeError('passengers should be a list of BusPassenger')
         if max_speed <= 0:
             raise TypeError('max_speed has to be a positive whole number. Cannot be a negative number or zero.')
-        self.name = name
-        self.position = position
+        self.name = sys.intern(str(name))
+        # Buses move every step so the coordinates are kept as separate
+        # attributes that can be updated in place.
+        self.x, self.y = position
         self.direction = direction
         self.passengers = list(passengers)
         self.capacity = capacity
@@ -195,31 +203,14 @@ class Bus(Printable):
         self.speed = speed
         self.max_speed = max_speed
 
-    def init_animation(self, ax):
-        """Initialise matplotlib animation for axes ax"""
-        self.bus_line, = ax.plot([], [], 'gs', markersize=10)
-        self.passenger_line, = ax.plot([], [], 'bo')
-        x, y = self.position
-        self.text = ax.text(x, y+3, self.name,
-                verticalalignment='bottom', horizontalalignment='center')
-        return [self.bus_line, self.passenger_line, self.text]
+    @property
+    def position(self):
+        """tuple(int,int), position of the bus"""
+        return (self.x, self.y)
 
-    def update_animation(self):
-        """Update matplotlib animation for axes ax"""
-        # Redraw the bus
-        x, y = self.position
-        self.bus_line.set_data([x], [y])
-        # Redraw the passengers
-        pspace = 2
-        num_passengers = len(self.passengers)
-        xdata = [x] * num_passengers
-        ydata = [y - pspace*(n+1) for n in range(num_passengers)]
-        self.passenger_line.set_data(xdata, ydata)
-        # Update text position
-        self.text.set_x(x)
-        self.text.set_y(y+3)
-        # Return the patches for matplotlib to update
-        return [self.bus_line, self.passenger_line, self.text]
+    @position.setter
+    def position(self, position):
+        self.x, self.y = position
 
 
 class BusNetwork(Printable):
@@ -235,7 +226,9 @@ class BusNetwork(Printable):
     rates: dict[str,float] (optional) rates of passengers arriving
 
     A LinearBusRoute instances holds a complete model of the state of all
-    buses, bus stops and passengers along its route.
+    buses, bus stops and passengers along its route. The stops themselves are
+    fixed once the network is created: lookups on them are cached, so the
+    stops list should not be modified afterwards.
 
     Examples
     ========
@@ -267,12 +260,23 @@ class BusNetwork(Printable):
         self.stops = list(stops)
         self.buses = list(buses)
 
+        # Stops don't move so sort them by x-coordinate once for stops_passed
+        self._stops_by_x = sorted(self.stops, key=lambda stop: stop.position[0])
+        self._stop_xs = [stop.position[0] for stop in self._stops_by_x]
+        self._stop_names = tuple(stop.name for stop in self.stops)
+
         if rates is None:
             rates = {}
         else:
             rates = dict(rates)
         self.rates = rates
 
+    def stops_passed(self, old_x, new_x):
+        """List of stops with old_x < x <= new_x in order of x"""
+        lo = bisect_right(self._stop_xs, old_x)
+        hi = bisect_right(self._stop_xs, new_x)
+        return self._stops_by_x[lo:hi]
+
     def init(self):
         """Initialise the model after creating nand return events"""
         raise NotImplementedError("Subclasses should override this method")
@@ -283,53 +287,72 @@ class BusNetwork(Printable):
 
     def init_animation(self, ax):
         """Initialise matplotlib animation for axes ax"""
+        # NumPy is only needed for drawing so it is imported here rather than
+        # at the top of this module, and kept for update_animation.
+        from busstop import drawing
+        self._drawing = drawing
 
-        # Initialise self before child objects
-        patches = self._init_animation(ax)
-
-        # Initialise all buses
-        for bus in self.buses:
-            patches += bus.init_animation(ax)
-
-        # Initialise all bus stops
+        size = self.end - self.start
+        delta = size // 10
+        ax.set_xlim([self.start-delta, self.end+delta])
+        ax.set_ylim([-size//2, size//2])
+        self.route_line, = ax.plot([self.start, self.end], [0, 0], 'k-', linewidth=3)
+
+        # One collection each for all stops, queueing passengers, buses and
+        # passengers on buses so that a frame is a few set_offsets calls.
+        self.stop_scatter = ax.scatter([], [], marker='o', s=100, c='r')
+        self.queue_scatter = ax.scatter([], [], marker='o', s=36)
+        self.bus_scatter = ax.scatter([], [], marker='s', s=100, c='g')
+        self.bus_passenger_scatter = ax.scatter([], [], marker='o', s=36, c='b')
+        # Stops don't move, so their positions are converted only once
+        self.stop_positions = drawing.positions(self.stops)
+        self.stop_scatter.set_offsets(self.stop_positions)
+
+        self.stop_texts = []
         for stop in self.stops:
-            patches += stop.init_animation(ax)
+            x, y = stop.position
+            self.stop_texts.append(ax.text(x, y-3, stop.name, rotation=90,
+                verticalalignment='top', horizontalalignment='center'))
+        self.bus_texts = []
+        for bus in self.buses:
+            x, y = bus.position
+            self.bus_texts.append(ax.text(x, y+3, bus.name,
+                verticalalignment='bottom', horizontalalignment='center'))
 
-        # List of patches for matplotlib to update
-        return patches
+        # The route, stops and their names never change so they are left out
+        # of the patches returned to matplotlib and are drawn once into the
+        # blitting background.
+        return self.update_animation()
 
     def update_animation(self):
         """Update matplotlib animation for axes ax"""
+        positions = self._drawing.positions
+        stacked_offsets = self._drawing.stacked_offsets
 
-        # Redraw self before child objects
-        patches = self._update_animation()
-
-        # Redraw bus stops
+        # Redraw the queueing passengers. Passengers who have exhausted 100%
+        # of their patience are plotted first in red, the rest in blue.
+        qspace = 2
+        colours = []
         for stop in self.stops:
-            patches += stop.update_animation()
-
-        # Redraw buses
-        for bus in self.buses:
-            patches += bus.update_animation()
+            grumpy = [passenger.patience == 0 for passenger in stop.passengers]
+            grumpy.sort(reverse=True)
+            colours += ['r' if g else 'b' for g in grumpy]
+        counts = [len(stop.passengers) for stop in self.stops]
+        self.queue_scatter.set_offsets(stacked_offsets(self.stop_positions, counts, qspace))
+        self.queue_scatter.set_facecolor(colours)
+
+        # Redraw the buses and their passengers below them
+        pspace = 2
+        counts = [len(bus.passengers) for bus in self.buses]
+        bus_positions = positions(self.buses)
+        self.bus_scatter.set_offsets(bus_positions)
+        self.bus_passenger_scatter.set_offsets(stacked_offsets(bus_positions, counts, -pspace))
+        for bus, text in zip(self.buses, self.bus_texts):
+            text.set_position((bus.x, bus.y+3))
 
         # List of patches for matplotlib to update
-        return patches
-
-    def _init_animation(self, ax):
-        """Initialise self for animation in axes ax"""
-        size = self.end - self.start
-        delta = size // 10
-        ax.set_xlim([self.start-delta, self.end+delta])
-        ax.set_ylim([-size//2, size//2])
-        self.route_line, = ax.plot([], [], 'k-', linewidth=3)
-        return [self.route_line]
-
-    def _update_animation(self):
-        """Redraw self for animation in axes ax"""
-        xdata = [self.start, self.end]
-        ydata = [0, 0]
-        self.route_line.set_data(xdata, ydata)
-        return [self.route_line]
+        return [self.queue_scatter, self.bus_scatter,
+                self.bus_passenger_scatter, *self.bus_texts]
 
 
 if __name__ == "__main__":
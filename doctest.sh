@@ -2,3 +2,7 @@
 
 python3 -m busstop.objects
 python3 -m busstop.linear
+# The drawing helpers need NumPy, which the model itself does not
+if python3 -c 'import numpy' 2>/dev/null; then
+    python3 -m busstop.drawing
+fi